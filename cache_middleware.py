@@ -0,0 +1,59 @@
+from cachetools import TTLCache
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+'''
+Remembers GET responses for a short time so repeat requests for the same url never reach the endpoint at all
+
+Only responses that say Cache-Control: public are kept, the endpoint decides what is safe to share
+Requests with an Authorization header always go straight through since their responses can be different per user
+
+This is a plain ASGI middleware (a class with async __call__(scope, receive, send)) instead of BaseHTTPMiddleware,
+that way theres no extra Request / Response objects made for every request that passes through it
+'''
+
+
+class CacheMiddleware:
+    def __init__(self, app: ASGIApp, maxsize: int = 1024, ttl: float = 60):
+        self.app = app
+        self.cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl) # (path, query string) -> (status, headers, body)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "GET" or _has_header(scope["headers"], b"authorization"):
+            await self.app(scope, receive, send)
+            return
+
+        key = (scope["path"], scope["query_string"])
+        cached = self.cache.get(key)
+        if cached is not None:
+            status, headers, body = cached
+            # send a copy, middleware further out (like gzip) edits the headers list in place and would change the cached one
+            await send({"type": "http.response.start", "status": status, "headers": list(headers)})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        start: Message | None = None
+        chunks: list[bytes] = []
+
+        # pass everything through to the client as usual but keep a copy of the response on the way out
+        # whether to keep it is decided as soon as the status and headers arrive, so responses that can never be cached
+        # (like big streamed files) are not held in memory for nothing
+        async def send_and_store(message: Message) -> None:
+            nonlocal start
+            if message["type"] == "http.response.start":
+                if message["status"] == 200 and _is_public(message["headers"]):
+                    start = {**message, "headers": list(message["headers"])} # copy before gzip can edit them
+            elif message["type"] == "http.response.body" and start is not None:
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    self.cache[key] = (start["status"], start["headers"], b"".join(chunks))
+            await send(message)
+
+        await self.app(scope, receive, send_and_store)
+
+
+def _has_header(headers, name: bytes) -> bool:
+    return any(key.lower() == name for key, _ in headers)
+
+
+def _is_public(headers) -> bool:
+    return any(key.lower() == b"cache-control" and b"public" in value.lower() for key, value in headers)
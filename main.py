@@ -1,37 +1,75 @@
-from distro import name
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, Path, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict, computed_field
+import orjson
 
+from cache_middleware import CacheMiddleware # made in cache_middleware.py
+
+from array import array
+from collections import OrderedDict
+from enum import Enum
+from functools import lru_cache
+import itertools
 import os
 
 
 
 
 
-app = FastAPI()
-# to run the server cd into your fastapi folder then use the command fastapi dev main.py 
+app = FastAPI(default_response_class=ORJSONResponse) # orjson turns the returned data into json a lot faster than the normal json module
+# to run the server cd into your fastapi folder then use the command fastapi dev main.py
+# uvicorn (what fastapi dev runs under the hood) automatically uses uvloop for the event loop and httptools for parsing http
+# when they are installed, you can also force them with: uvicorn main:app --loop uvloop --http httptools
+# (uvloop doesnt support windows so there it just falls back to the normal asyncio loop)
+# fastapi dev is only for development (it reloads on every change), the Dockerfile shows how to run it for real
+
 
+# 1. keep GET responses marked Cache-Control: public in memory for 60 seconds (see cache_middleware.py)
+# the middleware that is added first ends up closest to the endpoints, so this runs inside CORS and gzip
+# and stores the plain response, the CORS / gzip headers for each client still get added on the way out
+app.add_middleware(CacheMiddleware, maxsize=1024, ttl=60)
 
-# 1. Enable CORS (Critical for the frontend to talk to the backend)
+# 2. Enable CORS (Critical for the frontend to talk to the backend)
+# set FRONTEND_ORIGINS to the frontend's url (comma seperated if theres more than one) instead of allowing every origin
+# (spaces after the commas are fine, leaving it unset or empty allows every origin)
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"], 
+    allow_origins=[origin.strip() for origin in (os.getenv("FRONTEND_ORIGINS") or "*").split(",") if origin.strip()],
     allow_methods=["*"],
     allow_headers=["*"],
+    max_age=86400, # lets the browser remember the OPTIONS preflight for a day instead of sending one before every request (chrome caps this at 2 hours)
 )
 
+# 3. gzip responses for clients that send Accept-Encoding: gzip, mostly helps the item lists which keep getting bigger
+# anything under 500 bytes (like / and /hello) is sent as is since compressing it isnt worth it
+app.add_middleware(GZipMiddleware, minimum_size=500, compresslevel=5)
+
+
+
+# responses that never change for a given url can be kept by the browser / a CDN for an hour without asking the server again
+_PUBLIC_CACHE = {"Cache-Control": "public, max-age=3600, immutable"}
 
+# these two routes always send back the same thing so the json is made once here instead of on every request
+_ROOT_BODY = orjson.dumps({"message": "Hello World"})
+_HELLO_BODY = orjson.dumps({"message": "Hello from the /hello route!"})
+
+# every endpoint in this file is async def, they all share one event loop so one blocking call stalls all of them
+# inside async def only use async libraries (httpx.AsyncClient not requests, await asyncio.sleep not time.sleep, an async db driver)
+# and push anything slow that only has a normal version into a thread with await asyncio.to_thread(...)
+# ruff check . (configured in pyproject.toml, also runs on github actions) catches the common blocking calls
 
 @app.get("/") # default route to test if the server is working
 async def root():
-    return {"message": "Hello World"}
+    return Response(_ROOT_BODY, media_type="application/json", headers=_PUBLIC_CACHE)
 
 
 #@something is a decorator in python which takes the function below and does something with it
 
 @app.get("/hello") # this is a path operation decorator which tells that the function below uses this method and route
 async def hello():
-    return {"message": "Hello from the /hello route!"}
+    return Response(_HELLO_BODY, media_type="application/json", headers=_PUBLIC_CACHE)
 
 
 
@@ -42,9 +80,14 @@ then you can use it in the function as an argument and its used when the functio
 basically you can have dynamic routes with path parameters
 '''
 
+# the same names tend to come up again and again, so remember the json for the last 1024 names used
+@lru_cache(maxsize=1024)
+def _greet_bytes(name: str) -> bytes:
+    return orjson.dumps({"message": f"Hello {name}"})
+
 @app.get("/hello/{name}") # this route will take a name as a path parameter and return a personalized greeting
-async def hello_name(name:str):
-    return {"message": f"Hello {name}"}
+async def hello_name(name: str = Path(max_length=64)): # max_length stops really long names from filling up the cache
+    return Response(_greet_bytes(name), media_type="application/json", headers=_PUBLIC_CACHE)
 
 # if you do type cast python automatically will convert to the required type if possible if not will throw e 
 # with python type declaration, Fast api automatically validates the input and will return an error if the input is bad 
@@ -68,20 +111,25 @@ which is more accurate and faster to process.
 ex:
 '''
 
-from enum import Enum
 class Food(str, Enum):
     pizza = "pizza"
     burger = "burger"
     sushi = "sushi"
 
+# each food maps to its message, built once when the server starts instead of comparing foodName on every request
+_FOOD_MSGS = {
+    Food.pizza: "You ordered pizza",
+    Food.burger: "You are getting burger",
+    Food.sushi: "You are getting sushi",
+}
+
 @app.get("/food/{foodName}") # route with foodName variable in path
 async def get_food(foodName: Food): # declare that the variable is of the type Food(enum)
-    if foodName == Food.pizza:
-        return {"message": "You ordered pizza"}
-
-    return {"message": f"You are getting {foodName.value}"} # .value gets the actual food not Food.foodname which is enum version
+    return ORJSONResponse({"message": _FOOD_MSGS[foodName]}, headers=_PUBLIC_CACHE)
 
-# in this case we use the enum to compare with the variable, not the variable compared to a string 
+# in this case we use the enum members as the dict keys, not the strings
+# (before this was an if check: if foodName == Food.pizza ... else f"You are getting {foodName.value}")
+# .value gets the actual food not Food.foodname which is enum version
 
 '''
 # error handling with parameters in paths is pretty simple with fast api 
@@ -98,11 +146,16 @@ These are parameters that are passed in the URL after the ?
 for ex:
 '''
 
-fake_db = [{"item_id": 1, "name": "item1"}, {"item_id": 2, "name": "item2"}, {"item_id": 3, "name": "item3"}]
+# fake_db is stored as one column per field instead of a list of dicts, row i is (_ids[i], _names[i])
+# the ids sit packed together in an array of plain ints so this stays small and quick to scan as it grows
+_ids = array("q", [1, 2, 3])
+_names = ["item1", "item2", "item3"]
 
 @app.get("/dbItems/") # route to get items with optional query parameter
-async def read_items(start: int = 0, limit: int = 10): # skip and limit are query parameters with default values
-    return fake_db[start : start + limit] # return a slice of the fake_db based on the skip and limit values
+async def read_items(start: int = Query(0, ge=0), limit: int = Query(10, ge=0)): # skip and limit are query parameters with default values
+    # only build the rows that are actually in the requested slice of the fake_db
+    end = min(start + limit, len(_ids))
+    return ORJSONResponse([{"item_id": _ids[i], "name": _names[i]} for i in range(start, end)])
 
 '''
 the query is the part of the url after ? and seperated by &
@@ -153,30 +206,59 @@ but you have a response body (info that the client wants to get)
 
 in a post request you have a request body for the backend to do something with like create update or info to be used in a function. 
 '''
-from pydantic import BaseModel 
 
 # this guarantees data is correct before it reaches the function. If data is incorrect it returns error 
 class Item(BaseModel): # make some class 
+    # frozen: items cant be changed after they are validated, so theres nothing to re-check later
+    # validate_assignment is already False by default, its written out so nobody turns it on by accident
+    # extra="forbid": sending fields that arent listed here (like the old total_price) is an error instead of being silently dropped
+    model_config = ConfigDict(frozen=True, validate_assignment=False, extra="forbid")
+
     name: str
     description: str | None = None
     price: float
     tax: float | None = None
-    total_price: float| None = None
     #tags: list[str] = [] 
 
+    # computed_field works out total_price from the other fields whenever the item is turned into json,
+    # so the client cant send it and create_item doesnt have to set it
+    @computed_field(return_type=float | None) # return_type is spelled out so it still works when main.py is compiled with cython (see setup.py)
+    @property
+    def total_price(self) -> float | None:
+        return None if self.tax is None else self.price + self.tax
+
 
 
 #GET should never change anything on the server. (Like looking at a menu).
 #POST is for when you want to create or change something. (Like placing an order).
 
-items: list[Item] = [] # list of Items
+# items are stored by id so looking one up or reading a page of them doesnt mean going through the whole list
+# OrderedDict instead of a normal dict so the oldest item can be removed quickly (see create_item)
+items: OrderedDict[int, Item] = OrderedDict() # id -> Item
+next_id = itertools.count(1) # gives out 1, 2, 3... for new items
+MAX_ITEMS = 100_000 # once there are this many items the oldest one is dropped for each new one, so memory cant grow forever
+
+# the GET endpoints below keep sending back the same items, so save the json bytes the first time and reuse them
+# items only changes in create_item so that is where the cache gets cleared
+# (each worker has its own copy of this, which is fine since each worker also has its own items)
+_cache: dict[str, bytes] = {} # "namePrice", "minimal" and "full" (only the default first page of /fullItem/)
+
+# goes up by one every time items changes, /fullItem/ uses it as its ETag so clients can tell if their copy is out of date
+# the random part changes every time the server starts, so an ETag from before a restart never matches by accident
+_boot_id = os.urandom(4).hex()
+_revision = 0
 
 # creates an item and adds it to items array 
 @app.post("/items/") # route to create an item with a request body
 async def create_item(item: Item): # declare that the request body should be of type Item
-    if item.tax is not None:
-        item.total_price = item.price + item.tax
-    items.append(item)
+    global _revision
+    items[next(next_id)] = item
+    if len(items) > MAX_ITEMS:
+        # popitem(last=False) removes the oldest item in O(1), with a normal dict deleting the first key over and over
+        # leaves empty slots at the front that every later lookup of the first key (and every page read) has to skip
+        items.popitem(last=False)
+    _cache.clear()
+    _revision += 1
     
     return "successfully added a new item"
 
@@ -202,8 +284,30 @@ The request body for a post request is usally long and contains lots of informat
 
 # print out the full item list
 @app.get("/fullItem/")
-async def read_items():
-    return items
+async def read_items(
+    start: int = Query(0, ge=0), # paged the same way as /dbItems/ so the response doesnt grow forever
+    limit: int = Query(50, ge=0, le=100), # Query(ge=..., le=...) makes fast api reject negative or huge values with a 422 before we get here
+    if_none_match: str | None = Header(None), # the ETag the client got last time, if it has one
+):
+    # if nothing was added since the client's copy, tell it to reuse that copy (304) instead of sending everything again
+    # the ETag is weak (W/) since gzip can send the same data compressed or not, a strong one has to differ between the two
+    etag = f'"{_boot_id}-{_revision}"'
+    headers = {"ETag": f"W/{etag}", "Cache-Control": "no-cache"} # no-cache means the client has to check the ETag with us before reusing it
+    if if_none_match is not None and etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+
+    # nothing to filter here so build the response ourselves, this skips fastapi's jsonable_encoder step
+    # orjson doesnt know about pydantic models so dump them to dicts first
+    # only the default page is cached, start and limit come from the client so caching every page
+    # would let one client fill up memory with a new entry for each start value
+    if start == 0 and limit == 50:
+        if "full" not in _cache:
+            _cache["full"] = orjson.dumps([item.model_dump() for item in itertools.islice(items.values(), 50)])
+        return Response(_cache["full"], media_type="application/json", headers=headers)
+
+    start = min(start, len(items)) # islice crashes on numbers bigger than sys.maxsize, past the end the page is just empty anyway
+    page = itertools.islice(items.values(), start, start + limit)
+    return Response(orjson.dumps([item.model_dump() for item in page]), media_type="application/json", headers=headers)
 
 #Response Body and Return Types # 
 #-------------------------------#
@@ -240,13 +344,9 @@ Some common decorators are:
 Also if you use these on a list of pydantic models -- like this (response_model = list[Item])
 you need to apply the decorator to every object in the list 
 
-you must use "__all__"  for include / exclude. See below endpoints for examples
+you must use "__all__"  for include / exclude. for ex:
 
-'''
-
-@app.get("/namePrice/", response_model = list[Item], response_model_include = {"__all__": {"price", "name"}}) # will return item descriptions only
-async def namePrice():
-    return items
+@app.get("/namePrice/", response_model = list[Item], response_model_include = {"__all__": {"price", "name"}})
 
 @app.get(
     "/minimalItem/",
@@ -254,8 +354,31 @@ async def namePrice():
     response_model_exclude={"__all__": {"description"}},
     response_model_exclude_none=True,
 )
+
+The catch is that fast api then validates and filters every field of every item on each request which gets slow as items grows.
+When the filtering is this simple its faster to just build the output ourselves, which is what the endpoints below do
+
+'''
+
+@app.get("/namePrice/") # will return item names and prices only
+async def namePrice():
+    if "namePrice" not in _cache:
+        _cache["namePrice"] = orjson.dumps([{"name": item.name, "price": item.price} for item in items.values()])
+    return Response(_cache["namePrice"], media_type="application/json")
+
+# reads the item's stored fields straight from __dict__ instead of going through model_dump's include/exclude handling
+# total_price isnt stored (its a computed_field) so it has to be added on its own
+def _minimal_item(item: Item) -> dict:
+    row = {key: value for key, value in item.__dict__.items() if key != "description" and value is not None}
+    if item.total_price is not None:
+        row["total_price"] = item.total_price
+    return row
+
+@app.get("/minimalItem/") # everything but the description, and leave out fields that are None
 async def itemsMinusDescription():
-    return items
+    if "minimal" not in _cache:
+        _cache["minimal"] = orjson.dumps([_minimal_item(item) for item in items.values()])
+    return Response(_cache["minimal"], media_type="application/json")
 
 # it is much cleaner to just define a new model though...
 
@@ -307,14 +430,17 @@ async def itemsMinusDescription():
 
 
 '''
+import asyncio
 from chatbot import getResponse # this is the function we created in chatbot.py to get the response from the chatbot
 
-class Query (BaseModel):
+class ChatQuery (BaseModel): # not called Query so it doesnt hide fastapi's Query used above
     message: str
 # endpoint for chat feature
 @app.post("/chat")
-async def chat(query: Query): # whatever query is passed has to follow the query class
-    response = getResponse(query.message)
+async def chat(query: ChatQuery): # whatever query is passed has to follow the query class
+    # getResponse is slow normal (not async) code, calling it directly would freeze every other request until it finishes
+    # asyncio.to_thread runs it in a seperate thread so the server keeps answering other requests meanwhile
+    response = await asyncio.to_thread(getResponse, query.message)
     #response = f"Bot received: {query.message}"
 
     return {"response": response}
@@ -0,0 +1,19 @@
+# optional: compiles main.py into a C extension with cython so the endpoint code skips the python bytecode interpreter
+# pip install "cython==3.1.*" then run: python setup.py build_ext --inplace
+# that puts a main.*.so / main.*.pyd next to main.py and python imports it instead of main.py, so uvicorn main:app still works
+# delete the .so / .pyd to go back to running plain main.py (and rebuild after every change to main.py)
+from Cython.Build import cythonize
+from setuptools import setup
+
+setup(
+    name="main",
+    ext_modules=cythonize(
+        "main.py",
+        compiler_directives={
+            "language_level": 3,
+            # keep cython from treating annotations like name: str as C types,
+            # fast api and pydantic need to read them as normal python annotations
+            "annotation_typing": False,
+        },
+    ),
+)
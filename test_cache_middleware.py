@@ -0,0 +1,57 @@
+from fastapi import FastAPI, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.testclient import TestClient
+
+from cache_middleware import CacheMiddleware
+
+
+def make_client():
+    app = FastAPI()
+    app.add_middleware(CacheMiddleware)
+    app.add_middleware(GZipMiddleware, minimum_size=500)
+    calls = []
+
+    @app.get("/big")
+    async def big():
+        calls.append(1)
+        return Response(b"x" * 2000, media_type="text/plain", headers={"Cache-Control": "public, max-age=60"})
+
+    return TestClient(app), calls
+
+
+def test_cached_response_works_for_gzip_and_identity_clients():
+    client, calls = make_client()
+
+    for _ in range(2):
+        response = client.get("/big", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.content == b"x" * 2000
+
+    response = client.get("/big", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["content-length"] == "2000"
+    assert response.content == b"x" * 2000
+
+    assert len(calls) == 1 # the endpoint only ran once, the rest came from the cache
+
+
+def test_responses_that_cant_be_cached_are_not_buffered():
+    app = FastAPI()
+    app.add_middleware(CacheMiddleware)
+
+    @app.get("/private")
+    async def private():
+        return Response(b"secret", headers={"Cache-Control": "private"})
+
+    @app.get("/missing")
+    async def missing():
+        return Response(b"nope", status_code=404, headers={"Cache-Control": "public"})
+
+    client = TestClient(app)
+    assert client.get("/private").content == b"secret"
+    assert client.get("/missing").status_code == 404
+
+    cache_middleware = app.middleware_stack
+    while not isinstance(cache_middleware, CacheMiddleware):
+        cache_middleware = cache_middleware.app
+    assert len(cache_middleware.cache) == 0